@@ -2,13 +2,22 @@
 Custom MD Simulation Creation Block for Horus
 """
 
+import functools
 import os
 import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from HorusAPI import Extensions, PluginVariable, SlurmBlock, VariableTypes
 
+# Horus remotes supported by the create_md_custom script
+_ALLOWED_MACHINES: frozenset[str] = frozenset(
+    {"csuc", "local", "picard", "slurm"}
+)
+
 # Inputs
 prmtop_input = PluginVariable(
     id="parameters_file",
@@ -91,6 +100,59 @@ prod_folder_variable = PluginVariable(
 )
 
 
+@functools.lru_cache(maxsize=8)
+def _md_script(plugin_dir: str) -> str:
+    """Resolve the MD setup script shipped with the plugin."""
+    return str(
+        Path(plugin_dir)
+        / "Include"
+        / "protocols"
+        / "MD"
+        / "cMD"
+        / "create_md_custom.sh"
+    )
+
+
+def _stage(src: Path, dst: Path):
+    """Hardlink a read-only input into a replica, copying if not possible."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _run_one(replica: int, cmd: list, workdir: Path):
+    """Run the setup script of a single replica inside its workdir."""
+    replica_tag = workdir.name
+
+    # Stream merged stdout/stderr so progress is visible while it runs
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        cwd=str(workdir),
+    ) as process:
+        assert process.stdout is not None
+        for line in process.stdout:
+            print(f"[replica {replica}] {line}", end="")
+        process.wait()
+        if process.returncode != 0:
+            print(f"Replica {replica} error executing script")
+            raise RuntimeError(
+                f"Replica {replica} script failed with exit code"
+                f" {process.returncode}"
+            )
+
+    # Log contents
+    for folder_path in [workdir / "preprod", workdir / "prod"]:
+        if folder_path.exists() and folder_path.is_dir():
+            print(f"  {replica_tag}/{folder_path.name}/")
+        else:
+            print(f"  {replica_tag}/{folder_path.name}/ (not found)")
+
+
 def run_script(block: SlurmBlock):
     """Generate and submit one or more replica MD setups."""
     prmtop_path = Path(block.inputs[prmtop_input.id])
@@ -112,13 +174,13 @@ def run_script(block: SlurmBlock):
 
     # Get the machine (horus remote)
     machine = block.remote.name
-    allowed_machines = ["csuc", "local", "picard", "slurm"]
 
-    if machine not in allowed_machines:
+    if machine not in _ALLOWED_MACHINES:
         raise ValueError(
             f"Machine '{machine}' is not supported. Allowed machines are:"
-            f" {', '.join(allowed_machines)}. Please update the plugin and the"
-            " create_md_custom script to support this machine."
+            f" {', '.join(sorted(_ALLOWED_MACHINES))}. Please update the"
+            " plugin and the create_md_custom script to support this"
+            " machine."
         )
 
     parent_workdir = Path(os.getcwd()) / "md_custom_workdir"
@@ -128,106 +190,117 @@ def run_script(block: SlurmBlock):
             " removing it now. All prior contents will be permanently"
             " deleted."
         )
-        shutil.rmtree(parent_workdir)
+        # Move the old tree out of the way atomically and delete it in the
+        # background; the deletion may keep using disk I/O for a while
+        # after this function returns.
+        trash = parent_workdir.with_name(
+            f"{parent_workdir.name}.trash.{os.getpid()}.{time.time_ns()}"
+        )
+        os.rename(parent_workdir, trash)
+        threading.Thread(
+            target=shutil.rmtree,
+            args=(trash,),
+            kwargs={"ignore_errors": True},
+            daemon=True,
+        ).start()
     os.makedirs(parent_workdir, exist_ok=True)
 
-    script_location = (
-        Path(block.pluginDir)
-        / "Include"
-        / "protocols"
-        / "MD"
-        / "cMD"
-        / "create_md_custom.sh"
-    )
-
-    remote_job_folders = []
+    script_location = _md_script(block.pluginDir)
+
+    # The command is identical for every replica; only the cwd changes
+    cmd = [
+        "bash",
+        script_location,
+        "-p",
+        prmtop_path.name,
+        "-c",
+        inpcrd_path.name,
+        "-r",
+        str(last_residue_value),
+        "-t",
+        str(temperature_value),
+        "-l",
+        str(length_value),
+        "-m",
+        machine,
+    ]
+    cmd_str = " ".join(cmd)
+
+    jobs = []
     for replica in range(1, replicas_value + 1):
         replica_tag = f"replica_{replica:02d}"
         workdir = parent_workdir / replica_tag
         os.makedirs(workdir, exist_ok=True)
 
-        shutil.copy2(prmtop_path, workdir / prmtop_path.name)
-        shutil.copy2(inpcrd_path, workdir / inpcrd_path.name)
-
-        prmtop = prmtop_path.name
-        inpcrd = inpcrd_path.name
-
-        out_preprod_folder = workdir / "preprod"
-        out_prod_folder = workdir / "prod"
-
-        cmd = [
-            "bash",
-            str(script_location),
-            "-p",
-            str(prmtop),
-            "-c",
-            str(inpcrd),
-            "-r",
-            str(last_residue_value),
-            "-t",
-            str(temperature_value),
-            "-l",
-            str(length_value),
-            "-m",
-            machine,
-        ]
+        _stage(prmtop_path, workdir / prmtop_path.name)
+        _stage(inpcrd_path, workdir / inpcrd_path.name)
 
         print(
             f"\n[Replica {replica}/{replicas_value}]\nExecuting script:"
-            f" {' '.join(cmd)}"
+            f" {cmd_str}"
         )
+        jobs.append((replica, cmd, workdir))
+
+    # The setup scripts only wait on subprocesses, so run them concurrently
+    max_workers = max(1, min(len(jobs), os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_run_one, replica, cmd, workdir)
+            for replica, cmd, workdir in jobs
+        ]
+        for future in as_completed(futures):
+            future.result()
 
-        with subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=str(workdir),
-        ) as process:
-            stdout, stderr = process.communicate()
-            if process.returncode != 0:
-                print(f"Replica {replica} error executing script: {stderr}")
-                raise RuntimeError(
-                    f"Replica {replica} script failed with error: {stderr}"
-                )
-            if stdout.strip():
-                print(f"Replica {replica} script stdout:\n{stdout}")
-            if stderr.strip():
-                print(f"Replica {replica} script stderr:\n{stderr}")
-
-        # Log contents
-        for folder_path in [out_preprod_folder, out_prod_folder]:
-            if folder_path.exists() and folder_path.is_dir():
-                print(f"  {replica_tag}/{folder_path.name}/")
-            else:
-                print(f"  {replica_tag}/{folder_path.name}/ (not found)")
-
+    for replica, _, workdir in jobs:
         out_slurm_file = workdir / "script.sh"
         if out_slurm_file.exists():
             Extensions().loadFile(
-                str(out_slurm_file), f"{replica_tag}_script.sh", readOnly=True
+                str(out_slurm_file),
+                f"{workdir.name}_script.sh",
+                readOnly=True,
             )
 
-        if block.remote.isLocal:
+    # Ship every replica in one transfer instead of one session per replica
+    remote_parent = None
+    if not block.remote.isLocal:
+        flow_name = block.flow.name.replace(" ", "_")
+        remote_root = os.path.join(block.remote.workDir, flow_name)
+        print(f"Creating remote root directory at {remote_root}...")
+        block.remote.command(f"mkdir -p {remote_root}")
+        print("Transferring workdir to remote...")
+        remote_parent = block.remote.sendData(str(parent_workdir), remote_root)
+
+    remote_workdirs = {}
+    lock = threading.Lock()
+
+    def _submit_one(replica, workdir):
+        out_slurm_file = workdir / "script.sh"
+        if remote_parent is None:
             job_id = block.remote.submitJob(str(out_slurm_file))
         else:
-            flow_name = block.flow.name.replace(" ", "_")
-            remote_root = os.path.join(block.remote.workDir, flow_name)
-            print(f"Creating remote root directory at {remote_root}...")
-            block.remote.command(f"mkdir -p {remote_root}")
-            print("Transferring workdir to remote...")
-            remote_workdir = block.remote.sendData(str(workdir), remote_root)
+            remote_workdir = os.path.join(remote_parent, workdir.name)
             remote_script_path = os.path.join(
                 remote_workdir, out_slurm_file.name
             )
-            print("Submitting job on remote...")
+            print(f"Submitting {workdir.name} job on remote...")
             job_id = block.remote.submitJob(remote_script_path)
-            remote_job_folders.append(remote_workdir)
+            with lock:
+                remote_workdirs[replica] = remote_workdir
 
-        print("Submitted job with ID:", job_id)
+        print(f"Submitted {workdir.name} job with ID:", job_id)
 
-    if remote_job_folders:
-        block.extraData["remote_job_folders"] = remote_job_folders
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_submit_one, replica, workdir)
+            for replica, _, workdir in jobs
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+    if remote_workdirs:
+        block.extraData["remote_job_folders"] = [
+            remote_workdirs[replica] for replica in sorted(remote_workdirs)
+        ]
 
 
 def download_data(block: SlurmBlock):
@@ -249,6 +322,7 @@ def download_data(block: SlurmBlock):
                 "Warning: remote job folders count does not match replicas;"
                 " attempting partial download."
             )
+        transfers = []
         for idx, remote_folder in enumerate(remote_job_folders, start=1):
             replica_tag = f"replica_{idx:02d}"
             local_replica_dir = parent_workdir / replica_tag
@@ -256,30 +330,61 @@ def download_data(block: SlurmBlock):
             for sub in ["preprod", "prod"]:
                 remote_sub = os.path.join(remote_folder, sub)
                 local_sub = local_replica_dir / sub
-                print(f"Downloading {sub} for {replica_tag}...")
-                block.remote.getData(remote_sub, str(local_sub))
+                transfers.append((remote_sub, str(local_sub)))
+
+        def _fetch(remote_sub, local_sub):
+            print(f"Downloading {remote_sub}...")
+            block.remote.getData(remote_sub, local_sub)
+
+        # Each fetch is latency bound, so overlap them
+        if transfers:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                futures = [
+                    executor.submit(_fetch, remote_sub, local_sub)
+                    for remote_sub, local_sub in transfers
+                ]
+                for future in as_completed(futures):
+                    future.result()
 
     aggregated_preprod = parent_workdir / "preprod_replicas"
     aggregated_prod = parent_workdir / "prod_replicas"
     os.makedirs(aggregated_preprod, exist_ok=True)
     os.makedirs(aggregated_prod, exist_ok=True)
 
+    # Scan directories once and use the cached dirent types, avoiding a
+    # stat per candidate (expensive on network filesystems)
+    with os.scandir(aggregated_preprod) as it:
+        existing_pre = {entry.name for entry in it}
+    with os.scandir(aggregated_prod) as it:
+        existing_prod = {entry.name for entry in it}
+
     for replica in range(1, replicas_value + 1):
         replica_tag = f"replica_{replica:02d}"
         rep_dir = parent_workdir / replica_tag
-        for sub, agg in [
-            ("preprod", aggregated_preprod),
-            ("prod", aggregated_prod),
+        try:
+            with os.scandir(rep_dir) as it:
+                entries = {
+                    entry.name
+                    for entry in it
+                    if entry.is_dir(follow_symlinks=False)
+                }
+        except FileNotFoundError:
+            continue
+        for sub, agg, existing in [
+            ("preprod", aggregated_preprod, existing_pre),
+            ("prod", aggregated_prod, existing_prod),
         ]:
+            name = f"{replica_tag}_{sub}"
+            if sub not in entries or name in existing:
+                continue
             src = rep_dir / sub
-            if src.exists():
-                link_name = agg / f"{replica_tag}_{sub}"
-                if not link_name.exists():
-                    try:
-                        os.symlink(src, link_name)
-                    except OSError:
-                        with open(link_name, "w", encoding="utf-8") as fh:
-                            fh.write(str(src))
+            link_name = agg / name
+            try:
+                os.symlink(src, link_name)
+            except OSError:
+                with open(link_name, "w", encoding="utf-8") as fh:
+                    fh.write(str(src))
+            existing.add(name)
 
     block.setOutput(preprod_folder_variable.id, str(aggregated_preprod))
     block.setOutput(prod_folder_variable.id, str(aggregated_prod))
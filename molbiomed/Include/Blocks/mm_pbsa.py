@@ -2,6 +2,7 @@
 MM-PBSA Setup Block for Horus
 """
 
+import functools
 import subprocess
 from pathlib import Path
 
@@ -107,6 +108,18 @@ script_file_variable = PluginVariable(
 )
 
 
+@functools.lru_cache(maxsize=8)
+def _mmpbsa_script(plugin_dir: str) -> str:
+    """Resolve the MM-PBSA setup script shipped with the plugin."""
+    return str(
+        Path(plugin_dir)
+        / "Include"
+        / "protocols"
+        / "MM-PBSA"
+        / "mmpbsa_setup.sh"
+    )
+
+
 def run_script(block: PluginBlock):
     """
     Executes the MM-PBSA setup script with provided inputs and variables.
@@ -114,28 +127,22 @@ def run_script(block: PluginBlock):
     prmtop = Path(block.inputs[prmtop_input.id])
     traj = Path(block.inputs[trajectory_input.id])
 
-    job_name = str(block.variables[job_name_variable.id])
+    job_name = block.variables[job_name_variable.id]
     frames = int(block.variables[frames_variable.id])
-    solvent_mask = str(block.variables[solvent_mask_variable.id])
-    ligand_mask = str(block.variables[ligand_mask_variable.id])
-    output_prefix = str(block.variables[output_prefix_variable.id])
-    pb_radius = str(block.variables[pb_radius_variable.id])
-    cluster = str(block.variables[cluster_variable.id])
+    solvent_mask = block.variables[solvent_mask_variable.id]
+    ligand_mask = block.variables[ligand_mask_variable.id]
+    output_prefix = block.variables[output_prefix_variable.id]
+    pb_radius = block.variables[pb_radius_variable.id]
+    cluster = block.variables[cluster_variable.id]
     run_now = bool(block.variables[submit_variable.id])
 
-    script_location = (
-        Path(block.pluginDir)
-        / "Include"
-        / "protocols"
-        / "MM-PBSA"
-        / "mmpbsa_setup.sh"
-    )
+    script_location = _mmpbsa_script(block.pluginDir)
 
     workdir = Path(block.pluginDir)
 
     cmd = [
         "bash",
-        str(script_location),
+        script_location,
         "-j",
         job_name,
         "-t",
@@ -156,36 +163,33 @@ def run_script(block: PluginBlock):
         cluster,
     ]
 
-    with subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        cwd=str(workdir),
-    ) as process:
-        stdout, stderr = process.communicate()
-        if process.returncode != 0:
-            print(f"- Error executing setup script: {stderr}")
-            raise RuntimeError(f"MM-PBSA setup failed: {stderr}")
-        print(f"Setup stdout:\n{stdout}\nSetup stderr:\n{stderr}")
-
-    script_file = workdir / "script_mmpbsa.sh"
-    input_file = workdir / "mmpbsa.in"
-
-    if run_now and script_file.exists():
-        run_cmd = ["bash", str(script_file)]
+    def _run(run_cmd, label):
         with subprocess.Popen(
             run_cmd,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
+            bufsize=1,
             cwd=str(workdir),
         ) as process:
-            stdout, stderr = process.communicate()
+            assert process.stdout is not None
+            for line in process.stdout:
+                print(f"[{label}] {line}", end="")
+            process.wait()
             if process.returncode != 0:
-                print(f"- Error executing MM-PBSA script: {stderr}")
-                raise RuntimeError(f"MM-PBSA execution failed: {stderr}")
-            print(f"Execution stdout:\n{stdout}\nExecution stderr:\n{stderr}")
+                print(f"- Error executing MM-PBSA {label} script")
+                raise RuntimeError(
+                    f"MM-PBSA {label} failed with exit code"
+                    f" {process.returncode}"
+                )
+
+    _run(cmd, "setup")
+
+    script_file = workdir / "script_mmpbsa.sh"
+    input_file = workdir / "mmpbsa.in"
+
+    if run_now and script_file.exists():
+        _run(["bash", str(script_file)], "run")
 
     block.setOutput(input_file_variable.id, str(input_file))
     block.setOutput(script_file_variable.id, str(script_file))